@@ -129,19 +129,87 @@ def mock_file_object(string):
 
 
 @contextmanager
-def mock_printer(obj):
+def mock_passthrough(obj, attribute):
+    """Patches `obj.attribute` with a mock that wraps the original, so the
+    patch can stay active across many tests (e.g. from a module-scoped
+    fixture). Use `stub_passthrough` to stub it out for a single test.
+
+    Caveats:
+        - Only *calls* are passed through. Non-callable attributes of the
+          mock (e.g. `sys.argv`, if wrapping a module) come back as mocks,
+          not the original values.
+        - Every call made while the patch is active is recorded, including
+          real calls outside `stub_passthrough`. These records are cleared
+          when a stub starts and ends, and again when the patch is removed.
+    """
+    with mock.patch.object(
+        obj,
+        attribute,
+        wraps=getattr(obj, attribute),
+    ) as m:
+        try:
+            yield m
+        finally:
+            m.reset_mock()
+
+
+@contextmanager
+def stub_passthrough(m, **configuration):
+    """Configures a mock from `mock_passthrough` for the duration of the block,
+    with fresh call records, then clears them and restores it to call through
+    to the original.
+
+    :type configuration: Dict[str, Any]
+    :param configuration: passed to `configure_mock`, e.g. `return_value`.
+    """
+    m.reset_mock()
+    m.configure_mock(**configuration)
+    try:
+        yield m
+    finally:
+        m.reset_mock(return_value=True, side_effect=True)
+
+
+@contextmanager
+def mock_printer(obj, mode='full'):
     """
     :type obj: module
+
+    :type mode: str
+    :param mode: what to retain of the printed output.
+        `full` keeps everything, `last_line` keeps only the last printed line,
+        and `json` keeps only output starting from the last printed JSON object.
     """
+    if mode not in ('full', 'last_line', 'json'):
+        raise ValueError('Unknown mock_printer mode: {}'.format(mode))
+
     class PrinterShim:
         def __init__(self):
             self.clear()
 
         def add(self, message, *args, **kwargs):
-            self.message += str(message) + '\n'
+            message = str(message)
+            if mode == 'last_line':
+                self._chunks.clear()
+                message = message.rstrip('\n').rsplit('\n', 1)[-1]
+            elif mode == 'json' and message.lstrip().startswith('{'):
+                self._chunks.clear()
+
+            self._chunks.append(message + '\n')
+            self._message = None
 
         def clear(self):
-            self.message = ''
+            self._chunks = []
+            self._message = ''
+
+        @property
+        def message(self):
+            # Joined lazily, since repeated concatenation is quadratic
+            # for large outputs (e.g. printed baselines).
+            if self._message is None:
+                self._message = ''.join(self._chunks)
+
+            return self._message
 
     shim = PrinterShim()
     with mock.patch.object(obj, 'print', shim.add):
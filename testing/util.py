@@ -3,12 +3,22 @@ import re
 from detect_secrets.plugins.base import RegexBasedDetector
 from detect_secrets.plugins.common.util import import_plugins
 
+# orjson is a development requirement, for faster parsing of scan output in
+# tests. Fall back to json when running without the development requirements.
+try:
+    from orjson import loads  # noqa: F401
+except ImportError:
+    from json import loads  # noqa: F401
+
 
 # https://stackoverflow.com/questions/14693701/how-can-i-remove-the-ansi-escape-sequences-from-a-string-in-python
 _ansi_escape = re.compile(r'\x1b\[[0-?]*[ -/]*[@-~]')
 
 
 def uncolor(text):
+    if '\x1b' not in text:
+        return text
+
     return _ansi_escape.sub('', text)
 
 
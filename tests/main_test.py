@@ -1,7 +1,8 @@
+import copy
 import json
-import shlex
 import textwrap
 from contextlib import contextmanager
+from contextlib import ExitStack
 
 import mock
 import pytest
@@ -9,34 +10,41 @@ import pytest
 from detect_secrets import main as main_module
 from detect_secrets import VERSION
 from detect_secrets.core import audit as audit_module
+from detect_secrets.core import baseline as baseline_module
 from detect_secrets.core.constants import POTENTIAL_SECRET_DETECTED_NOTE
 from detect_secrets.main import main
 from detect_secrets.plugins.common.util import import_plugins
 from testing.factories import secrets_collection_factory
 from testing.mocks import Any
+from testing.mocks import mock_passthrough
 from testing.mocks import mock_printer
+from testing.mocks import stub_passthrough
+from testing.util import loads
 from testing.util import uncolor
 
 
+ANY_TUPLE = Any(tuple)
+ANY_DICT = Any(dict)
+
+
 def get_list_of_plugins(include=None, exclude=None):
     """
     :type include: List[Dict[str, Any]]
     :type exclude: Iterable[str]
     :rtype: List[Dict[str, Any]]
     """
-    included_plugins = []
+    skipped_plugins = frozenset(exclude or ())
     if include:  # pragma: no cover
-        included_plugins = [
+        skipped_plugins |= frozenset(
             config['name']
             for config in include
-        ]
+        )
+
+    plugins = import_plugins()
 
     output = []
-    for name, plugin in import_plugins().items():
-        if (
-            name in included_plugins or
-            exclude and name in exclude
-        ):
+    for name, plugin in plugins.items():
+        if name in skipped_plugins:
             continue
 
         payload = {
@@ -52,7 +60,7 @@ def get_list_of_plugins(include=None, exclude=None):
     return sorted(output, key=lambda x: x['name'])
 
 
-def get_plugin_report(extra=None, exclude=[]):
+def get_plugin_report(extra=None, exclude=()):
     """
     :type extra: Dict[str, str]
     :type exclude: Iterable[str]
@@ -60,22 +68,118 @@ def get_plugin_report(extra=None, exclude=[]):
     if not extra:       # pragma: no cover
         extra = {}
 
-    longest_name_length = max([
-        len(name)
-        for name in import_plugins()
-    ])
+    excluded_plugins = frozenset(exclude)
+    plugins = import_plugins()
+    longest_name_length = max(map(len, plugins))
+    names = sorted(
+        plugin_name
+        for plugin_name in plugins
+        if plugin_name not in excluded_plugins
+    )
 
     return '\n'.join(
-        sorted([
-            '{name}: {result}'.format(
-                name=name + ' ' * (longest_name_length - len(name)),
-                result='False' if name not in extra else extra[name],
-            )
-            for name in import_plugins() if name not in exclude
-        ]),
+        '{name:<{width}}: {result}'.format(
+            name=name,
+            width=longest_name_length,
+            result=extra.get(name, 'False'),
+        )
+        for name in names
     ) + '\n'
 
 
+# Expected `plugins_used` payloads for the `--use-all-plugins` update cases.
+# These are built once here, rather than inline within the parametrize list.
+GHE_DETECTOR_CONFIG = {
+    'name': 'GheDetector',
+    'ghe_instance': 'github.ibm.com',
+}
+ALL_PLUGINS_WITH_BASE64_LIMIT_1_5 = get_list_of_plugins(
+    include=[
+        {
+            'base64_limit': 1.5,
+            'name': 'Base64HighEntropyString',
+        },
+        GHE_DETECTOR_CONFIG,
+    ],
+    exclude=(
+        'Db2Detector',
+    ),
+)
+ALL_PLUGINS_WITHOUT_BASE64_AND_PRIVATE_KEY = get_list_of_plugins(
+    include=[
+        GHE_DETECTOR_CONFIG,
+    ],
+    exclude=(
+        'Base64HighEntropyString',
+        'PrivateKeyDetector',
+        'Db2Detector',
+    ),
+)
+ALL_PLUGINS_WITHOUT_HEX_AND_KEYWORD_WITH_BASE64_LIMIT_5_5 = get_list_of_plugins(
+    include=[
+        {
+            'base64_limit': 5.5,
+            'name': 'Base64HighEntropyString',
+        },
+        GHE_DETECTOR_CONFIG,
+    ],
+    exclude=(
+        'HexHighEntropyString',
+        'KeywordDetector',
+        'Db2Detector',
+    ),
+)
+ALL_PLUGINS_WITHOUT_HEX_AND_KEYWORD_WITH_BASE64_LIMIT_2_5 = get_list_of_plugins(
+    include=[
+        {
+            'base64_limit': 2.5,
+            'name': 'Base64HighEntropyString',
+        },
+        GHE_DETECTOR_CONFIG,
+    ],
+    exclude=(
+        'HexHighEntropyString',
+        'KeywordDetector',
+        'Db2Detector',
+    ),
+)
+
+
+# Expected audit output for test_audit_short_file, dedented once at import.
+AUDIT_SHORT_FILE_TEMPLATE = textwrap.dedent("""
+    Secret:      1 of 1
+    Filename:    %s
+    Secret Type: %s
+    ----------
+    %s
+    ----------
+    %s
+    ----------
+    Saving progress...
+""")[1:]
+FIRST_LINE_PHP_CONTEXT = textwrap.dedent("""
+    1:secret = 'notHighEnoughEntropy'
+    2:skipped_sequential_false_positive = '0123456789a'
+    3:print('second line')
+    4:var = 'third line'
+""")[1:-1]
+MIDDLE_LINE_YML_CONTEXT = textwrap.dedent("""
+    1:deploy:
+    2:    user: aaronloo
+    3:    password:
+    4:        secure: thequickbrownfoxjumpsoverthelazydog
+    5:    on:
+    6:        repo: Yelp/detect-secrets
+""")[1:-1]
+LAST_LINE_INI_CONTEXT = textwrap.dedent("""
+    1:[some section]
+    2:secrets_for_no_one_to_find =
+    3:    hunter2
+    4:    password123
+    5:    BEEF0123456789a
+""")[1:-1]
+
+
 class TestMain:
     """These are smoke tests for the console usage of detect_secrets.
     Most of the functional test cases should be within their own module tests.
@@ -86,7 +190,7 @@ class TestMain:
             assert main(['scan']) == 0
 
         mock_baseline_initialize.assert_called_once_with(
-            plugins=Any(tuple),
+            plugins=ANY_TUPLE,
             exclude_files_regex=None,
             exclude_lines_regex=None,
             path='.',
@@ -100,10 +204,10 @@ class TestMain:
 
     def test_scan_with_rootdir(self, mock_baseline_initialize):
         with mock_stdin():
-            assert main('scan test_data'.split()) == 0
+            assert main(['scan', 'test_data']) == 0
 
         mock_baseline_initialize.assert_called_once_with(
-            plugins=Any(tuple),
+            plugins=ANY_TUPLE,
             exclude_files_regex=None,
             exclude_lines_regex=None,
             path=['test_data'],
@@ -118,11 +222,15 @@ class TestMain:
     def test_scan_with_exclude_args(self, mock_baseline_initialize):
         with mock_stdin():
             assert main(
-                'scan --exclude-files some_pattern_here --exclude-lines other_patt'.split(),
+                [
+                    'scan',
+                    '--exclude-files', 'some_pattern_here',
+                    '--exclude-lines', 'other_patt',
+                ],
             ) == 0
 
         mock_baseline_initialize.assert_called_once_with(
-            plugins=Any(tuple),
+            plugins=ANY_TUPLE,
             exclude_files_regex='some_pattern_here',
             exclude_lines_regex='other_patt',
             path='.',
@@ -166,7 +274,7 @@ class TestMain:
         ), mock_printer(
             main_module,
         ) as printer_shim:
-            assert main('scan --string'.split()) == 0
+            assert main(['scan', '--string']) == 0
             assert uncolor(printer_shim.message) == get_plugin_report(
                 {
                     'Base64HighEntropyString': expected_base64_result,
@@ -182,7 +290,7 @@ class TestMain:
         ), mock_printer(
             main_module,
         ) as printer_shim:
-            assert main('scan --string 012345'.split()) == 0
+            assert main(['scan', '--string', '012345']) == 0
             assert uncolor(printer_shim.message) == get_plugin_report(
                 {
                     'Base64HighEntropyString': 'False (2.585)',
@@ -196,7 +304,7 @@ class TestMain:
         ), mock_printer(
             main_module,
         ) as printer_shim:
-            assert main('scan --db2-scan --string 012345'.split()) == 0
+            assert main(['scan', '--db2-scan', '--string', '012345']) == 0
             assert uncolor(printer_shim.message) == get_plugin_report({
                 'Base64HighEntropyString': 'False (2.585)',
                 'HexHighEntropyString': 'False (2.121)',
@@ -204,10 +312,10 @@ class TestMain:
 
     def test_scan_with_all_files_flag(self, mock_baseline_initialize):
         with mock_stdin():
-            assert main('scan --all-files'.split()) == 0
+            assert main(['scan', '--all-files']) == 0
 
         mock_baseline_initialize.assert_called_once_with(
-            plugins=Any(tuple),
+            plugins=ANY_TUPLE,
             exclude_files_regex=None,
             exclude_lines_regex=None,
             path='.',
@@ -225,7 +333,7 @@ class TestMain:
 
         mock_merge_baseline.assert_called_once_with(
             {'key': 'value'},
-            Any(dict),
+            ANY_DICT,
         )
 
     def test_reads_old_baseline_from_file(self, mock_merge_baseline):
@@ -235,14 +343,14 @@ class TestMain:
         ) as m_read, mock.patch(
             'detect_secrets.main.write_baseline_to_file',
         ) as m_write:
-            assert main('scan --update old_baseline_file'.split()) == 0
+            assert main(['scan', '--update', 'old_baseline_file']) == 0
             assert m_read.call_args[0][0] == 'old_baseline_file'
             assert m_write.call_args[1]['filename'] == 'old_baseline_file'
-            assert m_write.call_args[1]['data'] == Any(dict)
+            assert m_write.call_args[1]['data'] == ANY_DICT
 
         mock_merge_baseline.assert_called_once_with(
             {'key': 'value'},
-            Any(dict),
+            ANY_DICT,
         )
 
     def test_reads_non_existed_baseline_from_file(
@@ -258,13 +366,13 @@ class TestMain:
         ) as m_read, mock.patch(
             'detect_secrets.main.write_baseline_to_file',
         ) as m_write:
-            assert main('scan --update non_existed_baseline_file'.split()) == 0
+            assert main(['scan', '--update', 'non_existed_baseline_file']) == 0
             assert m_read.call_args[0][0] == 'non_existed_baseline_file'
             assert m_write.call_args[1]['filename'] == 'non_existed_baseline_file'
-            assert m_write.call_args[1]['data'] == Any(dict)
+            assert m_write.call_args[1]['data'] == ANY_DICT
 
         mock_baseline_initialize.assert_called_once_with(
-            plugins=Any(tuple),
+            plugins=ANY_TUPLE,
             exclude_files_regex='^non_existed_baseline_file$',
             exclude_lines_regex=None,
             path='.',
@@ -286,22 +394,22 @@ class TestMain:
             side_effect=io_error,
         ) as m_read:
             with pytest.raises(IOError):
-                main('scan --update non_existed_baseline_file'.split()) == 0
+                main(['scan', '--update', 'non_existed_baseline_file']) == 0
             assert m_read.call_args[0][0] == 'non_existed_baseline_file'
 
     @pytest.mark.parametrize(
         'exclude_files_arg, expected_regex',
         [
             (
-                '',
+                (),
                 '^old_baseline_file$',
             ),
             (
-                '--exclude-files "secrets/.*"',
+                ('--exclude-files', 'secrets/.*'),
                 'secrets/.*|^old_baseline_file$',
             ),
             (
-                '--exclude-files "^old_baseline_file$"',
+                ('--exclude-files', '^old_baseline_file$'),
                 '^old_baseline_file$',
             ),
         ],
@@ -320,11 +428,7 @@ class TestMain:
             'detect_secrets.main.write_baseline_to_file',
         ) as file_writer:
             assert main(
-                shlex.split(
-                    'scan --update old_baseline_file {}'.format(
-                        exclude_files_arg,
-                    ),
-                ),
+                ['scan', '--update', 'old_baseline_file', *exclude_files_arg],
             ) == 0
 
             assert (
@@ -345,7 +449,7 @@ class TestMain:
                         'name': 'PrivateKeyDetector',
                     },
                 ],
-                '--no-base64-string-scan --no-keyword-scan',
+                ('--no-base64-string-scan', '--no-keyword-scan'),
                 [
                     {
                         'name': 'PrivateKeyDetector',
@@ -359,22 +463,8 @@ class TestMain:
                         'name': 'Base64HighEntropyString',
                     },
                 ],
-                '--use-all-plugins',
-                get_list_of_plugins(
-                    include=[
-                        {
-                            'base64_limit': 1.5,
-                            'name': 'Base64HighEntropyString',
-                        },
-                        {
-                            'name': 'GheDetector',
-                            'ghe_instance': 'github.ibm.com',
-                        },
-                    ],
-                    exclude=(
-                        'Db2Detector',
-                    ),
-                ),
+                ('--use-all-plugins',),
+                ALL_PLUGINS_WITH_BASE64_LIMIT_1_5,
             ),
             (  # Remove some plugins from all plugins
                 [
@@ -384,20 +474,8 @@ class TestMain:
                     },
                 ],
 
-                '--use-all-plugins --no-base64-string-scan --no-private-key-scan',
-                get_list_of_plugins(
-                    include=(
-                        {
-                            'name': 'GheDetector',
-                            'ghe_instance': 'github.ibm.com',
-                        },
-                    ),
-                    exclude=(
-                        'Base64HighEntropyString',
-                        'PrivateKeyDetector',
-                        'Db2Detector',
-                    ),
-                ),
+                ('--use-all-plugins', '--no-base64-string-scan', '--no-private-key-scan'),
+                ALL_PLUGINS_WITHOUT_BASE64_AND_PRIVATE_KEY,
             ),
             (  # Use same plugin list from baseline
                 [
@@ -409,7 +487,7 @@ class TestMain:
                         'name': 'PrivateKeyDetector',
                     },
                 ],
-                '',
+                (),
                 [
                     {
                         'base64_limit': 3.5,
@@ -429,7 +507,7 @@ class TestMain:
                         'name': 'PrivateKeyDetector',
                     },
                 ],
-                '--base64-limit=5.5',
+                ('--base64-limit=5.5',),
                 [
                     {
                         'base64_limit': 5.5,
@@ -446,7 +524,7 @@ class TestMain:
                         'name': 'PrivateKeyDetector',
                     },
                 ],
-                '--base64-limit=4.5',
+                ('--base64-limit=4.5',),
                 [
                     {
                         'name': 'PrivateKeyDetector',
@@ -463,24 +541,13 @@ class TestMain:
                         'name': 'PrivateKeyDetector',
                     },
                 ],
-                '--use-all-plugins --base64-limit=5.5 --no-hex-string-scan --no-keyword-scan',
-                get_list_of_plugins(
-                    include=[
-                        {
-                            'base64_limit': 5.5,
-                            'name': 'Base64HighEntropyString',
-                        },
-                        {
-                            'name': 'GheDetector',
-                            'ghe_instance': 'github.ibm.com',
-                        },
-                    ],
-                    exclude=(
-                        'HexHighEntropyString',
-                        'KeywordDetector',
-                        'Db2Detector',
-                    ),
+                (
+                    '--use-all-plugins',
+                    '--base64-limit=5.5',
+                    '--no-hex-string-scan',
+                    '--no-keyword-scan',
                 ),
+                ALL_PLUGINS_WITHOUT_HEX_AND_KEYWORD_WITH_BASE64_LIMIT_5_5,
             ),
             (  # Use plugin limit from baseline when using --use-all-plugins and no input limit
                 [
@@ -492,24 +559,8 @@ class TestMain:
                         'name': 'PrivateKeyDetector',
                     },
                 ],
-                '--use-all-plugins --no-hex-string-scan --no-keyword-scan',
-                get_list_of_plugins(
-                    include=[
-                        {
-                            'base64_limit': 2.5,
-                            'name': 'Base64HighEntropyString',
-                        },
-                        {
-                            'name': 'GheDetector',
-                            'ghe_instance': 'github.ibm.com',
-                        },
-                    ],
-                    exclude=(
-                        'HexHighEntropyString',
-                        'KeywordDetector',
-                        'Db2Detector',
-                    ),
-                ),
+                ('--use-all-plugins', '--no-hex-string-scan', '--no-keyword-scan'),
+                ALL_PLUGINS_WITHOUT_HEX_AND_KEYWORD_WITH_BASE64_LIMIT_2_5,
             ),
         ],
     )
@@ -534,11 +585,7 @@ class TestMain:
             'detect_secrets.main.write_baseline_to_file',
         ) as file_writer:
             assert main(
-                shlex.split(
-                    'scan --update old_baseline_file {}'.format(
-                        plugins_overwriten,
-                    ),
-                ),
+                ['scan', '--update', 'old_baseline_file', *plugins_overwriten],
             ) == 0
 
             assert (
@@ -552,75 +599,30 @@ class TestMain:
         [
             (
                 'test_data/short_files/first_line.php',
-                textwrap.dedent("""
-                    1:secret = 'notHighEnoughEntropy'
-                    2:skipped_sequential_false_positive = '0123456789a'
-                    3:print('second line')
-                    4:var = 'third line'
-                """)[1:-1],
+                FIRST_LINE_PHP_CONTEXT,
             ),
             (
                 'test_data/short_files/middle_line.yml',
-                textwrap.dedent("""
-                    1:deploy:
-                    2:    user: aaronloo
-                    3:    password:
-                    4:        secure: thequickbrownfoxjumpsoverthelazydog
-                    5:    on:
-                    6:        repo: Yelp/detect-secrets
-                """)[1:-1],
+                MIDDLE_LINE_YML_CONTEXT,
             ),
             (
                 'test_data/short_files/last_line.ini',
-                textwrap.dedent("""
-                    1:[some section]
-                    2:secrets_for_no_one_to_find =
-                    3:    hunter2
-                    4:    password123
-                    5:    BEEF0123456789a
-                """)[1:-1],
+                LAST_LINE_INI_CONTEXT,
             ),
         ],
     )
-    def test_audit_short_file(self, filename, expected_output):
-        with mock_stdin(), mock_printer(
-            # To extract the baseline output
-            main_module,
-        ) as printer_shim:
-            main(['scan', filename])
-            baseline = printer_shim.message
+    def test_audit_short_file(self, mock_audit, baselines, filename, expected_output):
+        baseline_dict = baselines[filename]
 
-        baseline_dict = json.loads(baseline)
-        with mock_stdin(), mock.patch(
-            # To pipe in printer_shim
-            'detect_secrets.core.audit._get_baseline_from_file',
-            return_value=baseline_dict,
-        ), mock.patch(
-            # We don't want to clear the pytest testing screen
-            'detect_secrets.core.audit._clear_screen',
-        ), mock.patch(
-            # Gotta mock it, because tests aren't interactive
-            'detect_secrets.core.audit._get_user_decision',
-            return_value='s',
-        ), mock.patch(
-            # We don't want to write an actual file
-            'detect_secrets.core.audit.write_baseline_to_file',
-        ), mock_printer(
+        # To pipe in the scanned baseline
+        mock_audit['_get_baseline_from_file'].return_value = baseline_dict
+
+        with mock_stdin(), mock_printer(
             audit_module,
         ) as printer_shim:
-            main('audit will_be_mocked'.split())
-
-            assert uncolor(printer_shim.message) == textwrap.dedent("""
-                Secret:      1 of 1
-                Filename:    {}
-                Secret Type: {}
-                ----------
-                {}
-                ----------
-                {}
-                ----------
-                Saving progress...
-            """)[1:].format(
+            main(['audit', 'will_be_mocked'])
+
+            assert uncolor(printer_shim.message) == AUDIT_SHORT_FILE_TEMPLATE % (
                 filename,
                 baseline_dict['results'][filename][0]['type'],
                 expected_output,
@@ -653,30 +655,25 @@ class TestMain:
             ),
         ],
     )
-    def test_audit_display_results(self, filename, expected_output):
-        with mock_stdin(), mock_printer(
-            main_module,
-        ) as printer_shim:
-            main(['scan', filename])
-            baseline = printer_shim.message
-
-        baseline_dict = json.loads(baseline)
+    def test_audit_display_results(self, baselines, filename, expected_output):
+        baseline_dict = baselines[filename]
         with mock.patch(
             'detect_secrets.core.audit._get_baseline_from_file',
             return_value=baseline_dict,
         ), mock_printer(
             audit_module,
+            mode='json',
         ) as printer_shim:
             main(['audit', '--display-results', 'MOCKED'])
 
-            assert json.loads(uncolor(printer_shim.message))['plugins'] == expected_output
+            assert loads(uncolor(printer_shim.message))['plugins'] == expected_output
 
     def test_audit_diff_not_enough_files(self):
-        assert main('audit --diff fileA'.split()) == 1
+        assert main(['audit', '--diff', 'fileA']) == 1
 
     def test_audit_same_file(self):
-        with mock_printer(main_module) as printer_shim:
-            assert main('audit --diff .secrets.baseline .secrets.baseline'.split()) == 0
+        with mock_printer(main_module, mode='last_line') as printer_shim:
+            assert main(['audit', '--diff', '.secrets.baseline', '.secrets.baseline']) == 0
             assert printer_shim.message.strip() == (
                 'No difference, because it\'s the same file!'
             )
@@ -696,27 +693,90 @@ def mock_stdin(response=None):
             yield
 
 
+@pytest.fixture(scope='module')
+def baselines():
+    """Scans each requested file once per module, and hands out a fresh
+    copy of its baseline on every lookup (since audit mutates it).
+    """
+    class BaselineCache(dict):
+        def __getitem__(self, filename):
+            if filename not in self:
+                with mock_stdin(), mock_printer(
+                    # To extract the baseline output
+                    main_module,
+                ) as printer_shim:
+                    main(['scan', filename])
+                    self[filename] = loads(printer_shim.message)
+
+            return copy.deepcopy(super().__getitem__(filename))
+
+    return BaselineCache()
+
+
+@pytest.fixture(scope='module')
+def patched_audit():
+    with ExitStack() as stack:
+        yield {
+            name: stack.enter_context(mock_passthrough(audit_module, name))
+            for name in (
+                '_clear_screen',
+                '_get_baseline_from_file',
+                '_get_user_decision',
+                'write_baseline_to_file',
+            )
+        }
+
+
 @pytest.fixture
-def mock_baseline_initialize():
+def mock_audit(patched_audit):
+    """Stubs out the audit helpers for the current test. By default, nothing
+    is cleared, read or written, and every secret is skipped.
+    """
+    with ExitStack() as stack:
+        yield {
+            name: stack.enter_context(
+                stub_passthrough(
+                    m,
+                    return_value='s' if name == '_get_user_decision' else None,
+                ),
+            )
+            for name, m in patched_audit.items()
+        }
+
+
+@pytest.fixture(scope='module')
+def patched_baseline_initialize():
+    with mock_passthrough(baseline_module, 'initialize') as m:
+        yield m
+
+
+@pytest.fixture
+def mock_baseline_initialize(patched_baseline_initialize):
     def mock_initialize_function(plugins, exclude_files_regex, *args, **kwargs):
         return secrets_collection_factory(
             plugins=plugins,
             exclude_files_regex=exclude_files_regex,
         )
 
-    with mock.patch(
-        'detect_secrets.main.baseline.initialize',
+    with stub_passthrough(
+        patched_baseline_initialize,
         side_effect=mock_initialize_function,
-    ) as mock_initialize:
-        yield mock_initialize
+    ) as m:
+        yield m
+
+
+@pytest.fixture(scope='module')
+def patched_merge_baseline():
+    with mock_passthrough(baseline_module, 'merge_baseline') as m:
+        yield m
 
 
 @pytest.fixture
-def mock_merge_baseline():
-    with mock.patch(
-        'detect_secrets.main.baseline.merge_baseline',
-    ) as m:
+def mock_merge_baseline(patched_merge_baseline):
+    with stub_passthrough(
+        patched_merge_baseline,
         # This return value needs to have the `results` key, so that it can
         # formatted appropriately for output.
-        m.return_value = {'results': {}}
+        return_value={'results': {}},
+    ) as m:
         yield m